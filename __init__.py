@@ -2,6 +2,7 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
+from sqlalchemy import inspect, text
 from .config import Config
 
 # Initialize extensions
@@ -26,11 +27,37 @@ def create_app(config_class=Config):
 
     # Import and register blueprints (our routes)
     # We import here to avoid circular dependencies
-    from . import routes
+    from . import routes, models
     app.register_blueprint(routes.main_bp)
 
     with app.app_context():
         # This will create the database tables if they don't exist
         db.create_all()
 
-    return app
\ No newline at end of file
+        # create_all() skips tables that already exist, so add indexes
+        # introduced after an existing app.db was created
+        existing = {index['name'] for index in inspect(db.engine).get_indexes('attendance')}
+        if 'uq_attendance_employee_date' not in existing:
+            _remove_duplicate_attendance(app)
+        for index in models.Attendance.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+    return app
+
+
+def _remove_duplicate_attendance(app):
+    """Keep only the newest row (highest id) per employee and date, so the unique index can be built."""
+    clashes = db.session.execute(text(
+        'SELECT employee_id, date, COUNT(*) FROM attendance '
+        'GROUP BY employee_id, date HAVING COUNT(*) > 1'
+    )).all()
+    if not clashes:
+        return
+    for employee_id, date, count in clashes:
+        app.logger.warning('Attendance for employee %s on %s had %d rows; keeping the newest',
+                           employee_id, date, count)
+    db.session.execute(text(
+        'DELETE FROM attendance WHERE id NOT IN '
+        '(SELECT MAX(id) FROM attendance GROUP BY employee_id, date)'
+    ))
+    db.session.commit()
\ No newline at end of file
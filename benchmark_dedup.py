@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+import numpy as np
+
+import claim_clustering
+import claim_dedup
+from embedding_store import NARRATIVE_THRESHOLD, SIMILAR_THRESHOLD, EmbeddingStore
+
+# ----------------------------
+# Settings
+# ----------------------------
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+SHARED_DIRECTION = 0.5         # Pulls all vectors towards one direction, like real CLIP embeddings
+TOPIC_WEIGHT = 1.06            # Same-topic claims: ~0.58 cosine apart (below NARRATIVE_THRESHOLD), ~0.76 to their centroid
+CLAIMS_PER_CLUSTER = 200       # Topics (and seeded clusters) per table size: k = n / CLAIMS_PER_CLUSTER
+INSERT_CHUNK = 10000
+
+# Query mix: (expected verdict, cosine similarity to a stored claim, reuse its phash)
+QUERY_KINDS = [
+    ("Exact Duplicate", 0.99, True),
+    ("Similar Image", 0.92, False),
+    ("Same Narrative", 0.75, False),
+    ("No Duplicate", None, False),
+]
+
+
+# ----------------------------
+# Synthetic Claims (CLIP mocked out)
+# ----------------------------
+class FakeClip:
+    """Stands in for CLIP: deterministic random embeddings, so the benchmark runs offline on CPU."""
+
+    def __init__(self, dim, seed, topics=1):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+        shared = self.rng.normal(size=dim)
+        self.shared = shared / np.linalg.norm(shared)
+        self.topics = self._unit(self.rng.normal(size=(topics, dim)))
+
+    @staticmethod
+    def _unit(vectors):
+        return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+    def embed(self, n, topics=None):
+        """n embeddings, each pulled towards one topic (random unless given)."""
+        if topics is None:
+            topics = self.rng.integers(0, len(self.topics), size=n)
+        vectors = self._unit(self.rng.normal(size=(n, self.dim)))
+        vectors += SHARED_DIRECTION * self.shared + TOPIC_WEIGHT * self.topics[topics]
+        return vectors.astype(np.float32)
+
+    def near(self, vector, similarity):
+        """A vector with the given cosine similarity to `vector`."""
+        unit = vector / np.linalg.norm(vector)
+        other = self.rng.normal(size=self.dim)
+        other -= other.dot(unit) * unit
+        other /= np.linalg.norm(other)
+        return (similarity * unit + np.sqrt(1 - similarity ** 2) * other).astype(np.float32)
+
+    def phash(self, n):
+        return [f"{h:016x}" for h in self.rng.integers(0, 2 ** 63, size=n)]
+
+
+def populate(db_file, n, clip, sample_size):
+    """Create a claims DB with n synthetic records, clustered by topic.
+
+    Returns a sample of (rowid, uid, phash, vector). The cluster tables are
+    seeded with one cluster per topic, as a previous re-cluster would leave them.
+    """
+    conn = sqlite3.connect(db_file)
+    claim_dedup.init_records_table(conn)
+    claim_clustering.init_tables(conn)
+    c = conn.cursor()
+
+    k = len(clip.topics)
+    sums = np.zeros((k, clip.dim), dtype=np.float64)
+    sizes = np.zeros(k, dtype=np.int64)
+    sample_rows = set(clip.rng.choice(n, min(sample_size, n), replace=False).tolist())
+    samples = []
+    for start in range(0, n, INSERT_CHUNK):
+        count = min(INSERT_CHUNK, n - start)
+        topics = clip.rng.integers(0, k, size=count)
+        vectors, hashes = clip.embed(count, topics), clip.phash(count)
+        rows = []
+        for i in range(count):
+            uid = str(uuid.UUID(int=int(clip.rng.integers(0, 2 ** 63))))[:8]
+            rows.append((uid, f"C{start + i}", f"O{start + i}", "US", "synthetic claim description", "Broken",
+                         hashes[i], vectors[i].tobytes()))
+            if start + i in sample_rows:
+                samples.append((start + i + 1, uid, hashes[i], vectors[i]))
+        c.executemany("INSERT INTO records VALUES (?,?,?,?,?,?,?,?)", rows)
+        # Rowids start at 1 and cluster ids are topic + 1
+        c.executemany("INSERT INTO record_clusters VALUES (?,?)",
+                      zip(range(start + 1, start + count + 1), (topics + 1).tolist()))
+        np.add.at(sums, topics, vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+        sizes += np.bincount(topics, minlength=k)
+        conn.commit()
+
+    centroids = FakeClip._unit(sums).astype(np.float32)
+    c.executemany("INSERT INTO clusters VALUES (?,?,?,?)",
+                  [(j + 1, centroids[j].tobytes(), int(sizes[j]), time.time()) for j in range(k) if sizes[j]])
+    conn.commit()
+    conn.close()
+    return samples
+
+
+def make_queries(clip, samples, count):
+    """Build (image_hash, embedding, expected verdict) queries cycling through QUERY_KINDS."""
+    queries = []
+    for i in range(count):
+        verdict, similarity, same_hash = QUERY_KINDS[i % len(QUERY_KINDS)]
+        _, _, stored_hash, stored_vector = samples[i % len(samples)]
+        if similarity is None:
+            vector = clip.embed(1)[0]
+        else:
+            vector = clip.near(stored_vector, similarity)
+        image_hash = stored_hash if same_hash else clip.phash(1)[0]
+        queries.append((image_hash, vector.tobytes(), verdict))
+    return queries
+
+
+# ----------------------------
+# Search Modes
+# ----------------------------
+def cosine_similarity(a, b):
+    a, b = np.frombuffer(a, dtype=np.float32), np.frombuffer(b, dtype=np.float32)
+    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+
+
+def loop_scan(cur, store, image_hash, embedding):
+    """The check_duplicates loop from before the EmbeddingStore: read every row and compare one by one.
+
+    No longer in the app; kept as the exact reference the store is measured against.
+    """
+    cur.execute("SELECT * FROM records")
+    for rec in cur.fetchall():
+        uid, _, _, _, _, _, stored_hash, stored_emb = rec
+        if stored_hash == image_hash:
+            return ("Exact Duplicate", uid)
+        sim = cosine_similarity(embedding, stored_emb)
+        if sim > SIMILAR_THRESHOLD:
+            return ("Similar Image", uid)
+        if sim > NARRATIVE_THRESHOLD:
+            return ("Same Narrative", uid)
+    return ("No Duplicate", None)
+
+
+# ----------------------------
+# Measurements
+# ----------------------------
+def _summary(seconds):
+    ms = np.array(seconds) * 1000
+    return {"mean_ms": float(ms.mean()), "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)), "max_ms": float(ms.max())}
+
+
+def measure_search(conn, store, search, queries):
+    """Per-claim latency, peak traced memory of one claim, and the verdicts returned."""
+    results, latencies = [], []
+    for image_hash, embedding, _ in queries:
+        start = time.perf_counter()
+        results.append(search(conn.cursor(), store, image_hash, embedding))
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    search(conn.cursor(), store, queries[0][0], queries[0][1])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict(_summary(latencies), peak_memory_bytes=peak, queries=len(queries)), results
+
+
+def recall(results, reference):
+    """Share of the reference's duplicate verdicts that a mode reproduces (same verdict and uid)."""
+    hits = [r == ref for r, ref in zip(results, reference) if ref[0] != "No Duplicate"]
+    agree = [r == ref for r, ref in zip(results, reference)]
+    return {"recall": float(np.mean(hits)) if hits else 1.0, "verdict_agreement": float(np.mean(agree))}
+
+
+def measure_saves(conn, db_file, store, clip, count):
+    """Latency of the app's save path: claim_dedup.insert_record + commit, then (given a store)
+    claim_dedup.index_record, i.e. the store append and assign_cluster.
+
+    assign_cluster reads every centroid, so it grows with k = n / CLAIMS_PER_CLUSTER.
+    The re-cluster that index_record starts every RECLUSTER_EVERY saves runs in the
+    background, as in the app; its cost is measured by measure_recluster. Only the
+    PNG write is left out.
+    """
+    latencies = []
+    for vector, image_hash in zip(clip.embed(count), clip.phash(count)):
+        embedding = vector.tobytes()
+        start = time.perf_counter()
+        record_id = claim_dedup.insert_record(conn, "benchsav", "C", "O", "US", "synthetic claim description",
+                                              "Broken", image_hash, embedding)
+        conn.commit()
+        if store is not None:
+            claim_dedup.index_record(conn, store, db_file, record_id, embedding)
+        latencies.append(time.perf_counter() - start)
+    # Don't let a background re-cluster spill into the next measurement
+    while claim_clustering.recluster_running():
+        time.sleep(0.05)
+    return _summary(latencies)
+
+
+def measure_recluster(db_file, store):
+    """Time and peak traced memory of one full claim_clustering.recluster over the table.
+
+    Amortised over the RECLUSTER_EVERY saves that trigger it.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    clusters = claim_clustering.recluster(db_file, store.path)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": seconds, "clusters": clusters, "peak_memory_bytes": peak,
+            "amortized_ms_per_save": seconds * 1000 / claim_clustering.RECLUSTER_EVERY}
+
+
+def run_size(workdir, n, args):
+    clip = FakeClip(args.dim, args.seed + n, topics=max(1, n // CLAIMS_PER_CLUSTER))
+    # Fresh files per size: populate() relies on rowids starting at 1
+    size_dir = os.path.join(workdir, str(n))
+    shutil.rmtree(size_dir, ignore_errors=True)
+    os.makedirs(size_dir)
+    db_file = os.path.join(size_dir, "claims.db")
+
+    start = time.perf_counter()
+    samples = populate(db_file, n, clip, sample_size=args.queries)
+    populate_seconds = time.perf_counter() - start
+    conn = sqlite3.connect(db_file)
+    queries = make_queries(clip, samples, args.queries)
+
+    result = {"rows": n, "populate_seconds": populate_seconds, "db_bytes": os.path.getsize(db_file),
+              "modes": {}}
+
+    # The loop is the exact reference; at large sizes it only sees the first --loop-queries claims
+    loop_queries = queries[:args.loop_queries] if n > args.loop_limit else queries
+    loop_stats, reference = measure_search(conn, None, loop_scan, loop_queries)
+    loop_stats["bytes_per_scan"] = conn.execute(
+        "SELECT SUM(LENGTH(embedding) + LENGTH(description) + LENGTH(image_hash)) FROM records").fetchone()[0]
+    loop_stats.update(recall(reference, reference))
+    result["modes"]["loop"] = loop_stats
+
+    stores = {}
+    for dtype in args.dtypes:
+        store = EmbeddingStore(os.path.join(size_dir, f"embeddings_{dtype}"), dtype=dtype)
+        start = time.perf_counter()
+        store.sync(conn)
+        build_seconds = time.perf_counter() - start
+
+        stats, found = measure_search(conn, store, claim_dedup.find_duplicate, queries)
+        stats.update(recall(found[:len(reference)], reference))
+        stats["expected_verdict_agreement"] = float(np.mean([f[0] == q[2] for f, q in zip(found, queries)]))
+        stats["bytes_per_scan"] = store.nbytes()
+        stats["build_seconds"] = build_seconds
+        result["modes"][f"store_{dtype}"] = stats
+        stores[dtype] = store
+
+    result["save"] = {"records_only": measure_saves(conn, db_file, None, clip, args.saves)}
+    for dtype, store in stores.items():
+        store.sync(conn)  # Rows inserted by the other modes' saves
+        result["save"][f"store_{dtype}"] = measure_saves(conn, db_file, store, clip, args.saves)
+
+    # Last, since it replaces the seeded clusters
+    if n <= args.recluster_limit and stores:
+        result["recluster"] = measure_recluster(db_file, stores[args.dtypes[0]])
+    conn.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the claim dedup path as the records table grows.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated table sizes")
+    parser.add_argument("--dim", type=int, default=512, help="Embedding size (CLIP ViT-B/32 is 512)")
+    parser.add_argument("--queries", type=int, default=40, help="Claims checked per size")
+    parser.add_argument("--loop-queries", type=int, default=4, help="Claims checked by the slow loop on big tables")
+    parser.add_argument("--loop-limit", type=int, default=100000, help="Table size above which --loop-queries applies")
+    parser.add_argument("--saves", type=int, default=20, help="Inserts timed per size and mode")
+    parser.add_argument("--recluster-limit", type=int, default=100000,
+                        help="Largest table size to time a full re-cluster on")
+    parser.add_argument("--dtypes", default="float16,int8", help="EmbeddingStore dtypes to compare")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Where to build the databases (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated databases")
+    parser.add_argument("--output", default="bench_dedup.json", help="Machine-readable report path")
+    args = parser.parse_args()
+    args.dtypes = [d for d in args.dtypes.split(",") if d]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_dedup_")
+    os.makedirs(workdir, exist_ok=True)
+    report = {
+        "benchmark": "claim_dedup",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                        "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "params": {k: v for k, v in vars(args).items() if k not in ("workdir", "keep", "output")},
+        "results": [],
+    }
+    try:
+        for n in (int(s) for s in args.sizes.split(",")):
+            print(f"--- {n:,} rows")
+            result = run_size(workdir, n, args)
+            report["results"].append(result)
+            for mode, stats in result["modes"].items():
+                print(f"{mode:>20}: p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms  "
+                      f"peak {stats['peak_memory_bytes'] / 2 ** 20:8.1f} MiB  "
+                      f"scan {stats['bytes_per_scan'] / 2 ** 20:8.1f} MiB  recall {stats['recall']:.3f}")
+            for mode, stats in result["save"].items():
+                print(f"{'save ' + mode:>20}: p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms")
+            if "recluster" in result:
+                stats = result["recluster"]
+                print(f"{'recluster':>20}: {stats['seconds']:9.2f} s  {stats['clusters']} clusters  "
+                      f"peak {stats['peak_memory_bytes'] / 2 ** 20:8.1f} MiB  "
+                      f"+{stats['amortized_ms_per_save']:.2f} ms/save amortised")
+            # Written after every size so a long run still leaves a partial report
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import current_app, request, session
+from markupsafe import Markup
+
+from . import db
+from .models import PageVersion, dialect_insert
+
+# Version of a page nothing has bumped yet
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# --- Version Counters ---
+# Kept in the page_version table rather than in memory, so every worker
+# process (e.g. gunicorn -w N) sees a write made by any other one.
+
+def _now():
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def _bump(scope, key):
+    """Adds one to a page's version in the current transaction; the caller commits."""
+    now = _now().replace(tzinfo=None)
+    stmt = dialect_insert(PageVersion.__table__).values(scope=scope, key=key, version=1, modified_at=now)
+    stmt = stmt.on_conflict_do_update(index_elements=['scope', 'key'],
+                                      set_={'version': PageVersion.version + 1, 'modified_at': now})
+    db.session.execute(stmt)
+
+
+def _version(scope, key):
+    row = db.session.execute(
+        db.select(PageVersion.version, PageVersion.modified_at).filter_by(scope=scope, key=key)
+    ).first()
+    if row is None:
+        return 0, _EPOCH
+    return row.version, row.modified_at.replace(tzinfo=timezone.utc)
+
+
+def bump_manager(manager_id):
+    """Marks everything shown on a manager's dashboard as changed.
+
+    Call before committing the write, so no other process can serve the new
+    data under the old version.
+    """
+    _bump('manager', manager_id)
+
+
+def bump_employee(employee_id):
+    """Marks an employee's detail page (projects, attendance, profile) as changed.
+
+    Like bump_manager, call before committing the write.
+    """
+    _bump('employee', employee_id)
+
+
+def manager_version(manager_id):
+    """Returns (version, last_modified) for a manager's dashboard."""
+    return _version('manager', manager_id)
+
+
+def employee_version(employee_id):
+    """Returns (version, last_modified) for an employee's detail page."""
+    return _version('employee', employee_id)
+
+
+# --- Validators / Conditional GET ---
+
+def _csrf_window():
+    """Returns the index and start time of the current CSRF token lifetime window."""
+    time_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    if not time_limit:
+        return 0, _EPOCH
+    index = int(_now().timestamp() // time_limit)
+    return index, datetime.fromtimestamp(index * time_limit, tz=timezone.utc)
+
+
+def make_etag(*parts):
+    """Builds an ETag from the given parts plus the session's CSRF token window.
+
+    Every page embeds a CSRF token, so a cached copy is only reusable within
+    the same session and before that token expires.
+    """
+    window, _ = _csrf_window()
+    raw = '|'.join(str(part) for part in (session.get('csrf_token', ''), window) + parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def last_modified(*timestamps):
+    """Returns the latest of the given timestamps and the CSRF window start."""
+    _, window_start = _csrf_window()
+    return max((window_start,) + timestamps)
+
+
+def conditional_response(etag, modified):
+    """Returns a 304 response if the client's copy is still current, else None."""
+    # Pending flash messages are only shown on a full render.
+    if session.get('_flashes'):
+        return None
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = request.if_modified_since is not None and modified <= request.if_modified_since
+
+    if not fresh:
+        return None
+    return add_validators(current_app.response_class(status=304), etag, modified)
+
+
+def add_validators(response, etag, modified):
+    """Attaches ETag/Last-Modified and forces the browser to revalidate."""
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+# --- Fragment Cache ---
+
+class FragmentCache:
+    """Small LRU cache of rendered template fragments, keyed by version tuples."""
+
+    def __init__(self):
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, key, render_func):
+        """Returns the cached fragment for key, rendering and storing it on a miss."""
+        max_size = current_app.config.get('FRAGMENT_CACHE_SIZE', 0)
+        if not max_size:
+            return Markup(render_func())
+
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+
+        fragment = Markup(render_func())
+        with self._lock:
+            self._items[key] = fragment
+            self._items.move_to_end(key)
+            while len(self._items) > max_size:
+                self._items.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,278 @@
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from embedding_store import open_store
+
+# ----------------------------
+# Settings
+# ----------------------------
+CLUSTER_SIMILARITY = 0.75   # Cosine similarity needed to join an existing cluster
+RECLUSTER_EVERY = 500       # New claims between background re-clusterings
+BATCH_SIZE = 256            # Mini-batch size for k-means
+KMEANS_ITERATIONS = 100
+SEED_COVERAGE = 0.9         # Re-seed k with the leader pass when fewer stored claims than this have a cluster
+
+_recluster_lock = threading.Lock()
+_recluster_thread = None
+_claims_since_recluster = 0
+
+
+# ----------------------------
+# Database Setup
+# ----------------------------
+def init_tables(conn):
+    """Create the cluster tables next to `records` (keyed by its rowid)."""
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS clusters (
+        cluster_id INTEGER PRIMARY KEY,
+        centroid BLOB,
+        size INTEGER,
+        updated_at REAL
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS record_clusters (
+        record_id INTEGER PRIMARY KEY,
+        cluster_id INTEGER
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_record_clusters_cluster ON record_clusters (cluster_id)")
+    conn.commit()
+
+
+# ----------------------------
+# Vector Helpers
+# ----------------------------
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _to_vector(embedding):
+    return _normalize(np.frombuffer(embedding, dtype=np.float32).astype(np.float32))
+
+
+def load_centroids(conn):
+    """Return (cluster_ids, sizes, centroid matrix) for all stored clusters."""
+    rows = conn.execute("SELECT cluster_id, size, centroid FROM clusters").fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), None
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    sizes = np.array([r[1] for r in rows], dtype=np.int64)
+    centroids = np.vstack([np.frombuffer(r[2], dtype=np.float32) for r in rows])
+    return ids, sizes, centroids
+
+
+# ----------------------------
+# Online Assignment
+# ----------------------------
+def _assign(c, record_id, vector, ids, sizes, centroids):
+    """Attach one vector to the nearest centroid or open a new cluster. Returns its cluster id."""
+    if centroids is not None:
+        sims = centroids @ vector
+        best = int(np.argmax(sims))
+        if sims[best] >= CLUSTER_SIMILARITY:
+            cluster_id = int(ids[best])
+            size = int(sizes[best]) + 1
+            # Running mean, kept on the unit sphere
+            centroid = _normalize(centroids[best] + (vector - centroids[best]) / size).astype(np.float32)
+            c.execute("UPDATE clusters SET centroid=?, size=?, updated_at=? WHERE cluster_id=?",
+                      (centroid.tobytes(), size, time.time(), cluster_id))
+            c.execute("INSERT OR REPLACE INTO record_clusters VALUES (?,?)", (record_id, cluster_id))
+            return cluster_id
+
+    c.execute("INSERT INTO clusters (centroid, size, updated_at) VALUES (?,?,?)",
+              (vector.astype(np.float32).tobytes(), 1, time.time()))
+    cluster_id = c.lastrowid
+    c.execute("INSERT OR REPLACE INTO record_clusters VALUES (?,?)", (record_id, cluster_id))
+    return cluster_id
+
+
+def assign_cluster(conn, record_id, embedding):
+    """Assign a newly stored claim to its cluster in O(k) and commit. Returns the cluster id.
+
+    A claim that already has a cluster (e.g. a retried job) keeps it.
+    """
+    # Hold the write lock while reading centroids so a finishing re-cluster can't swap them underneath
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute("SELECT cluster_id FROM record_clusters WHERE record_id=?", (record_id,)).fetchone()
+    if row is not None:
+        conn.commit()
+        return row[0]
+    ids, sizes, centroids = load_centroids(conn)
+    cluster_id = _assign(conn.cursor(), record_id, _to_vector(embedding), ids, sizes, centroids)
+    conn.commit()
+    return cluster_id
+
+
+# ----------------------------
+# Mini-batch K-Means
+# ----------------------------
+def minibatch_kmeans(store, k, init=None, count=None, batch_size=BATCH_SIZE, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical mini-batch k-means over the first `count` rows of an EmbeddingStore.
+
+    Only the sampled batches and one SCAN_CHUNK block at a time are held in
+    memory. Returns (centroids, labels).
+    """
+    rng = np.random.default_rng(seed)
+    n = len(store) if count is None else count
+    k = min(k, n)
+    if init is not None and len(init) >= k:
+        centroids = _normalize(np.array(init[:k], dtype=np.float32))
+    else:
+        centroids = _normalize(store.vectors(rng.choice(n, k, replace=False)))
+    counts = np.zeros(k, dtype=np.float64)
+
+    for _ in range(iterations):
+        batch = store.vectors(rng.choice(n, min(batch_size, n), replace=False))
+        labels = np.argmax(batch @ centroids.T, axis=1)
+        batch_counts = np.bincount(labels, minlength=k).astype(np.float64)
+        batch_sums = np.zeros_like(centroids)
+        np.add.at(batch_sums, labels, batch)
+
+        # Per-centre learning rate 1/count (Sculley's update, applied per batch)
+        counts += batch_counts
+        hit = batch_counts > 0
+        rate = np.zeros(k)
+        rate[hit] = batch_counts[hit] / counts[hit]
+        means = np.zeros_like(centroids)
+        means[hit] = batch_sums[hit] / batch_counts[hit, None]
+        centroids = _normalize(centroids + rate[:, None] * (means - centroids)).astype(np.float32)
+
+    labels = np.concatenate([np.argmax(block @ centroids.T, axis=1) for block in store.iter_vectors(n)])
+    return centroids, labels
+
+
+def leader_centroids(blocks, dim):
+    """Single pass of radius-threshold clustering over blocks of vectors; returns the cluster centroids."""
+    # Grown by doubling, so opening k clusters copies O(k*d) in total rather than O(k^2*d)
+    centroids = np.empty((1024, dim), dtype=np.float32)
+    sizes = np.zeros(1024, dtype=np.int64)
+    k = 0
+    for block in blocks:
+        for vector in _normalize(block):
+            if k:
+                sims = centroids[:k] @ vector
+                best = int(np.argmax(sims))
+                if sims[best] >= CLUSTER_SIMILARITY:
+                    sizes[best] += 1
+                    centroids[best] = _normalize(centroids[best] + (vector - centroids[best]) / sizes[best])
+                    continue
+            if k == len(centroids):
+                centroids = np.concatenate([centroids, np.empty_like(centroids)])
+                sizes = np.concatenate([sizes, np.zeros_like(sizes)])
+            centroids[k] = vector
+            sizes[k] = 1
+            k += 1
+    return centroids[:k].copy()
+
+
+def needs_seeding(conn, count):
+    """True if under SEED_COVERAGE of `count` stored claims have a cluster, e.g. claims stored before clustering."""
+    clustered = conn.execute("SELECT COUNT(*) FROM record_clusters").fetchone()[0]
+    return clustered < SEED_COVERAGE * count
+
+
+def recluster(db_file, store_path):
+    """Rebuild all clusters from the embedding store with mini-batch k-means.
+
+    Streams the memory-mapped store in chunks instead of loading every BLOB,
+    and uses its own connection so it can run on a background thread. Claims
+    stored while the k-means pass runs are assigned online at the end.
+    """
+    store = open_store(store_path)
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        init_tables(conn)
+        store.sync(conn)
+        count = len(store)
+        if not count:
+            return 0
+        record_ids = np.array(store.ids()[:count])
+        _, _, init = load_centroids(conn)
+        if init is None or needs_seeding(conn, count):
+            # First run over an existing table: the few clusters opened online since
+            # start-up say nothing about k, so let the radius threshold pick it
+            init = leader_centroids(store.iter_vectors(count), store.dim)
+
+        centroids, labels = minibatch_kmeans(store, len(init), init=init, count=count)
+        sizes = np.bincount(labels, minlength=len(centroids))
+
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("DELETE FROM clusters")
+        c.execute("DELETE FROM record_clusters")
+        new_ids = {}
+        now = time.time()
+        for j in np.flatnonzero(sizes):
+            c.execute("INSERT INTO clusters (centroid, size, updated_at) VALUES (?,?,?)",
+                      (centroids[j].tobytes(), int(sizes[j]), now))
+            new_ids[int(j)] = c.lastrowid
+        for start in range(0, count, 10000):
+            c.executemany("INSERT INTO record_clusters VALUES (?,?)",
+                          zip(record_ids[start:start + 10000].tolist(),
+                              [new_ids[label] for label in labels[start:start + 10000].tolist()]))
+
+        # Catch up on claims that arrived during the k-means pass
+        late = c.execute("SELECT rowid, embedding FROM records WHERE rowid > ? ORDER BY rowid",
+                         (int(record_ids.max()),)).fetchall()
+        for record_id, embedding in late:
+            ids, counts, current = load_centroids(conn)
+            _assign(c, record_id, _to_vector(embedding), ids, counts, current)
+        conn.commit()
+        return len(new_ids)
+    finally:
+        conn.close()
+
+
+def maybe_recluster(db_file, store_path, force=False):
+    """Count a new claim and start a background re-clustering every RECLUSTER_EVERY claims.
+
+    force=True starts one now. Returns False if none was started (e.g. one is already running).
+    """
+    global _recluster_thread, _claims_since_recluster
+    with _recluster_lock:
+        if not force:
+            _claims_since_recluster += 1
+            if _claims_since_recluster < RECLUSTER_EVERY:
+                return False
+        if _recluster_thread is not None and _recluster_thread.is_alive():
+            return False
+        _claims_since_recluster = 0
+        _recluster_thread = threading.Thread(target=recluster, args=(db_file, store_path), daemon=True)
+        _recluster_thread.start()
+        return True
+
+
+def recluster_running():
+    return _recluster_thread is not None and _recluster_thread.is_alive()
+
+
+# ----------------------------
+# Queries
+# ----------------------------
+def count_clusters(conn):
+    return conn.execute("SELECT COUNT(*) FROM clusters").fetchone()[0]
+
+
+def list_clusters(conn, limit=-1, offset=0):
+    """Return (cluster_id, size) rows, largest cluster first; limit=-1 returns all."""
+    return conn.execute("SELECT cluster_id, size FROM clusters ORDER BY size DESC, cluster_id LIMIT ? OFFSET ?",
+                        (limit, offset)).fetchall()
+
+
+def cluster_members(conn, cluster_id, limit=-1):
+    """Return the claims in one cluster, oldest first; limit=-1 returns all."""
+    return conn.execute("""
+        SELECT r.unique_image_id, r.customer_id, r.order_id, r.marketplace, r.description, r.damage_class, r.image_hash
+        FROM record_clusters rc JOIN records r ON r.rowid = rc.record_id
+        WHERE rc.cluster_id = ?
+        ORDER BY rc.record_id
+        LIMIT ?
+    """, (cluster_id, limit)).fetchall()
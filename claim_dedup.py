@@ -0,0 +1,69 @@
+import claim_clustering
+from embedding_store import NARRATIVE_THRESHOLD, SIMILAR_THRESHOLD
+
+# Dedup and storage steps of a claim, kept free of Streamlit and CLIP so the
+# app (test.py) and benchmark_dedup.py run the same code.
+
+
+# ----------------------------
+# Database Setup
+# ----------------------------
+def init_records_table(conn):
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS records (
+        unique_image_id TEXT,
+        customer_id TEXT,
+        order_id TEXT,
+        marketplace TEXT,
+        description TEXT,
+        damage_class TEXT,
+        image_hash TEXT,
+        embedding BLOB
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_records_image_hash ON records (image_hash)")
+    conn.commit()
+
+
+# ----------------------------
+# Dedup
+# ----------------------------
+def find_duplicate(cur, store, image_hash, embedding):
+    """Return (verdict, matched unique_image_id) for a hashed and embedded claim."""
+    # Same verdict as scanning records in order: the earliest matching claim wins,
+    # and an exact hash match beats a similarity match on the same row
+    cur.execute("SELECT rowid, unique_image_id FROM records WHERE image_hash=? ORDER BY rowid LIMIT 1", (image_hash,))
+    hash_match = cur.fetchone()
+    match_rowid, sim = store.first_match(embedding, threshold=NARRATIVE_THRESHOLD)
+
+    if hash_match and (match_rowid is None or hash_match[0] <= match_rowid):
+        return ("Exact Duplicate", hash_match[1])
+    if match_rowid is not None:
+        cur.execute("SELECT unique_image_id FROM records WHERE rowid=?", (match_rowid,))
+        uid = cur.fetchone()[0]
+        return ("Similar Image" if sim > SIMILAR_THRESHOLD else "Same Narrative", uid)
+
+    return ("No Duplicate", None)
+
+
+# ----------------------------
+# Storage
+# ----------------------------
+def insert_record(db, unique_image_id, customer_id, order_id, marketplace, description, damage_class,
+                  image_hash, embedding):
+    """Insert the claim row without committing. Returns its rowid."""
+    cur = db.cursor()
+    cur.execute(
+        "INSERT INTO records VALUES (?,?,?,?,?,?,?,?)",
+        (unique_image_id, customer_id, order_id, marketplace, description, damage_class, image_hash, embedding)
+    )
+    return cur.lastrowid
+
+
+def index_record(db, store, db_file, record_id, embedding):
+    """Add a committed claim to the embedding store and its cluster; safe to repeat. Returns the cluster id."""
+    store.append([record_id], [embedding])
+    cluster_id = claim_clustering.assign_cluster(db, record_id, embedding)
+    claim_clustering.maybe_recluster(db_file, store.path)
+    return cluster_id
@@ -0,0 +1,219 @@
+import json
+import sqlite3
+import threading
+import time
+import traceback
+
+import numpy as np
+
+# ----------------------------
+# Settings
+# ----------------------------
+MAX_ATTEMPTS = 3          # Tries before a job is marked failed
+RETRY_BACKOFF = 2.0       # Seconds; doubles after every failed attempt
+LEASE_SECONDS = 300       # A running job older than this is assumed lost and re-queued
+POLL_INTERVAL = 0.5       # Idle worker sleep between queue checks
+STAGES = ("queue_wait", "decode", "phash", "embed", "dedup", "save")
+
+# Dedup + insert must see every earlier claim, so only this stage is serialised
+DEDUP_LOCK = threading.Lock()
+
+_pool_lock = threading.Lock()
+_workers = []
+
+
+# ----------------------------
+# Database Setup
+# ----------------------------
+def init_tables(conn):
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS claim_jobs (
+        job_id INTEGER PRIMARY KEY,
+        status TEXT,
+        customer_id TEXT,
+        order_id TEXT,
+        marketplace TEXT,
+        description TEXT,
+        damage_class TEXT,
+        image_bytes BLOB,
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at REAL,
+        created_at REAL,
+        started_at REAL,
+        finished_at REAL,
+        verdict TEXT,
+        unique_image_id TEXT,
+        record_id INTEGER,
+        stage_timings TEXT,
+        error TEXT
+    )
+    """)
+    # Queues created before jobs remembered their stored claim
+    columns = [row[1] for row in c.execute("PRAGMA table_info(claim_jobs)")]
+    if "record_id" not in columns:
+        c.execute("ALTER TABLE claim_jobs ADD COLUMN record_id INTEGER")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_claim_jobs_status ON claim_jobs (status, next_attempt_at)")
+    conn.commit()
+
+
+# ----------------------------
+# Queue Operations
+# ----------------------------
+def enqueue(conn, customer_id, order_id, marketplace, description, damage_class, image_bytes):
+    """Persist a claim submission and return its job id right away."""
+    now = time.time()
+    c = conn.cursor()
+    c.execute("""INSERT INTO claim_jobs (status, customer_id, order_id, marketplace, description, damage_class,
+                                         image_bytes, next_attempt_at, created_at)
+                 VALUES ('queued', ?, ?, ?, ?, ?, ?, ?, ?)""",
+              (customer_id, order_id, marketplace, description, damage_class, image_bytes, now, now))
+    conn.commit()
+    return c.lastrowid
+
+
+def get_job(conn, job_id):
+    """Return the job row as a dict (without the image bytes), or None."""
+    c = conn.execute("""SELECT job_id, status, attempts, created_at, started_at, finished_at,
+                               verdict, unique_image_id, stage_timings, error
+                        FROM claim_jobs WHERE job_id=?""", (job_id,))
+    row = c.fetchone()
+    if row is None:
+        return None
+    job = dict(zip([d[0] for d in c.description], row))
+    job["stage_timings"] = json.loads(job["stage_timings"]) if job["stage_timings"] else {}
+    return job
+
+
+def claim_batch(conn, batch_size):
+    """Atomically move up to batch_size due jobs to 'running' and return them as dicts."""
+    now = time.time()
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    # Jobs whose worker died mid-run become due again once their lease expires
+    c.execute("UPDATE claim_jobs SET status='queued' WHERE status='running' AND started_at < ?",
+              (now - LEASE_SECONDS,))
+    c.execute("""SELECT job_id, customer_id, order_id, marketplace, description, damage_class, image_bytes,
+                        attempts, created_at, record_id, verdict, unique_image_id
+                 FROM claim_jobs WHERE status='queued' AND next_attempt_at <= ?
+                 ORDER BY job_id LIMIT ?""", (now, batch_size))
+    columns = [d[0] for d in c.description]
+    jobs = [dict(zip(columns, row)) for row in c.fetchall()]
+    c.executemany("UPDATE claim_jobs SET status='running', attempts=attempts+1, started_at=? WHERE job_id=?",
+                  [(now, job["job_id"]) for job in jobs])
+    conn.commit()
+    for job in jobs:
+        job["attempts"] += 1
+        job["started_at"] = now
+    return jobs
+
+
+def link_record(conn, job_id, record_id, verdict, unique_image_id):
+    """Remember the `records` row a job inserted, without committing.
+
+    Run in the same transaction as the insert: a retry that finds record_id
+    set skips dedup and insert and only finishes indexing that row.
+    """
+    conn.execute("UPDATE claim_jobs SET record_id=?, verdict=?, unique_image_id=? WHERE job_id=?",
+                 (record_id, verdict, unique_image_id, job_id))
+
+
+def complete(conn, job_id, verdict, unique_image_id, stage_timings):
+    """Record a job's verdict and drop its image bytes (the claim now lives in `records`)."""
+    conn.execute("""UPDATE claim_jobs SET status='done', verdict=?, unique_image_id=?, stage_timings=?,
+                                          finished_at=?, image_bytes=NULL, error=NULL
+                    WHERE job_id=?""",
+                 (verdict, unique_image_id, json.dumps(stage_timings), time.time(), job_id))
+    conn.commit()
+
+
+def fail(conn, job, error):
+    """Re-queue a failed job with exponential backoff, or mark it failed after MAX_ATTEMPTS."""
+    if job["attempts"] >= MAX_ATTEMPTS:
+        conn.execute("UPDATE claim_jobs SET status='failed', error=?, finished_at=? WHERE job_id=?",
+                     (error, time.time(), job["job_id"]))
+    else:
+        delay = RETRY_BACKOFF * 2 ** (job["attempts"] - 1)
+        conn.execute("UPDATE claim_jobs SET status='queued', error=?, next_attempt_at=? WHERE job_id=?",
+                     (error, time.time() + delay, job["job_id"]))
+    conn.commit()
+
+
+# ----------------------------
+# Metrics
+# ----------------------------
+def queue_metrics(conn, recent=500):
+    """Queue depth per status plus mean/p50/p95 latency per stage over the last `recent` finished jobs."""
+    depth = dict(conn.execute("SELECT status, COUNT(*) FROM claim_jobs GROUP BY status").fetchall())
+    rows = conn.execute("""SELECT stage_timings, created_at, finished_at FROM claim_jobs
+                           WHERE status='done' ORDER BY finished_at DESC LIMIT ?""", (recent,)).fetchall()
+    samples = {stage: [] for stage in STAGES + ("total",)}
+    for timings, created_at, finished_at in rows:
+        for stage, seconds in json.loads(timings or "{}").items():
+            samples.setdefault(stage, []).append(seconds)
+        samples["total"].append(finished_at - created_at)
+
+    latency = {}
+    for stage, values in samples.items():
+        if values:
+            values = np.array(values)
+            latency[stage] = {"count": len(values), "mean": float(values.mean()),
+                              "p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95))}
+    return {"depth": {status: depth.get(status, 0) for status in ("queued", "running", "done", "failed")},
+            "latency": latency}
+
+
+# ----------------------------
+# Worker Pool
+# ----------------------------
+def _worker_loop(db_file, process_batch, batch_size):
+    conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False)
+    while True:
+        try:
+            jobs = claim_batch(conn, batch_size)
+        except sqlite3.OperationalError:
+            conn.rollback()
+            time.sleep(POLL_INTERVAL)
+            continue
+        if not jobs:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        try:
+            results = process_batch(conn, jobs)
+        except Exception:
+            # A whole-batch failure (e.g. the model forward pass) counts against every job in it
+            error = traceback.format_exc(limit=3)
+            results = {job["job_id"]: error for job in jobs}
+
+        for job in jobs:
+            result = results.get(job["job_id"], "No result returned")
+            if isinstance(result, str):
+                fail(conn, job, result)
+            else:
+                verdict, unique_image_id, timings = result
+                timings["queue_wait"] = job["started_at"] - job["created_at"]
+                complete(conn, job["job_id"], verdict, unique_image_id, timings)
+
+
+def start_workers(db_file, process_batch, workers=2, batch_size=8):
+    """Start the worker pool once per process; later calls are no-ops.
+
+    process_batch(conn, jobs) must return {job_id: (verdict, unique_image_id, stage_timings)}
+    for processed jobs and {job_id: error_text} for failed ones.
+    """
+    with _pool_lock:
+        if _workers:
+            return False
+        conn = sqlite3.connect(db_file, timeout=30)
+        init_tables(conn)
+        # Anything left 'running' belongs to a previous process
+        conn.execute("UPDATE claim_jobs SET status='queued' WHERE status='running'")
+        conn.commit()
+        conn.close()
+        for i in range(workers):
+            thread = threading.Thread(target=_worker_loop, args=(db_file, process_batch, batch_size),
+                                      name=f"claim-worker-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+        return True
@@ -16,7 +16,7 @@ elif ' ' in password:
     print('Password cannot contain spaces')
 elif password == email:
     print("Password and email cannot be the same")
-elif not(password[0].isalnum and password[-1].isalnum):
+elif not(password[0].isalnum() and password[-1].isalnum()):
     print('Password should start with letter/number')
 elif not(any(char.isupper() for char in password) and any(char.islower() for char in password)):
     print('Password should contain uppercase and lowercase letters')
@@ -13,4 +13,10 @@ class Config:
     # This will create a file named 'app.db' in the main directory
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, '..', 'app.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Server-side cache of rendered page fragments (calendar grid, project list).
+    # Set to the maximum number of fragments to keep; 0 disables the cache.
+    # Each worker process keeps its own copy, keyed by the page versions in the
+    # page_version table, so it is safe to run several workers.
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE') or 0)
@@ -0,0 +1,185 @@
+# Bulk version of the checks in "conditional statement challenge.py" and "password entry.py":
+# stream a CSV of credential records, apply every rule to each record in one pass,
+# and report per-rule violation counts and the offending row IDs.
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+# (name, message) - a record's violations are a bitmask over this tuple
+RULES = (
+    ("empty", "Email/Password cannot be empty"),
+    ("email_spaces", "Email cannot contain spaces"),
+    ("password_length", "Password must be at least 8 characters"),
+    ("password_spaces", "Password cannot contain spaces"),
+    ("same_as_email", "Password and email cannot be the same"),
+    ("password_edges", "Password should start and end with a letter/number"),
+    ("password_case", "Password should contain uppercase and lowercase letters"),
+    ("email_domain", "Email must end with @gmail.com"),
+)
+EMPTY, EMAIL_SPACES, PASSWORD_LENGTH, PASSWORD_SPACES, SAME_AS_EMAIL, PASSWORD_EDGES, PASSWORD_CASE, EMAIL_DOMAIN = \
+    (1 << i for i in range(len(RULES)))
+
+MIN_PASSWORD_LENGTH = 8
+EMAIL_SUFFIX = "@gmail.com"
+CHUNK_BYTES = 4 * 1024 * 1024   # Raw CSV text handed to a worker at a time
+
+
+def check(email, password):
+    """Return the bitmask of every rule this email/password pair breaks (0 if valid)."""
+    if not password or not email:
+        return EMPTY
+
+    violations = 0
+    if " " in email:
+        violations |= EMAIL_SPACES
+    if not email.endswith(EMAIL_SUFFIX):
+        violations |= EMAIL_DOMAIN
+    if len(password) < MIN_PASSWORD_LENGTH:
+        violations |= PASSWORD_LENGTH
+    if " " in password:
+        violations |= PASSWORD_SPACES
+    if password == email:
+        violations |= SAME_AS_EMAIL
+    if not (password[0].isalnum() and password[-1].isalnum()):
+        violations |= PASSWORD_EDGES
+    # Same per-character test as the source scripts; lower()/upper() comparisons
+    # disagree on titlecase and other special Unicode letters
+    if not (any(char.isupper() for char in password) and any(char.islower() for char in password)):
+        violations |= PASSWORD_CASE
+    return violations
+
+
+def rule_names(mask):
+    return [name for i, (name, _) in enumerate(RULES) if mask & (1 << i)]
+
+
+# ----------------------------
+# Chunked processing
+# ----------------------------
+def read_chunks(f, chunk_bytes=CHUNK_BYTES):
+    """Yield lists of whole lines totalling roughly chunk_bytes each."""
+    while True:
+        lines = f.readlines(chunk_bytes)
+        if not lines:
+            return
+        yield lines
+
+
+def audit_chunk(args):
+    """Worker: parse one chunk of CSV lines and return (rows, bytes, per-rule counts, [(row_id, mask)])."""
+    lines, id_col, email_col, password_col = args
+    counts = [0] * len(RULES)
+    offenders = []
+    rows = 0
+    width = max(id_col, email_col, password_col) + 1
+    for record in csv.reader(lines):
+        if not record:
+            continue
+        rows += 1
+        if len(record) < width:
+            record = record + [""] * (width - len(record))
+        mask = check(record[email_col], record[password_col])
+        if mask:
+            offenders.append((record[id_col], mask))
+            for i in range(len(RULES)):
+                if mask & (1 << i):
+                    counts[i] += 1
+    return rows, sum(len(line) for line in lines), counts, offenders
+
+
+def audit_file(path, id_column="id", email_column="email", password_column="password",
+               violations_out=None, processes=None, chunk_bytes=CHUNK_BYTES, progress=None):
+    """Audit a CSV file across a process pool. Returns the summary report as a dict.
+
+    Offending rows are streamed to violations_out (a writable text file) as
+    `row_id,rules` lines rather than kept in memory. Quoted fields containing
+    newlines are not supported: chunks are split on line boundaries.
+    """
+    counts = [0] * len(RULES)
+    total_rows = violating_rows = processed_bytes = 0
+    file_bytes = os.path.getsize(path)
+    start = time.perf_counter()
+
+    writer = csv.writer(violations_out) if violations_out is not None else None
+    if writer:
+        writer.writerow(["row_id", "rules"])
+
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        header = next(csv.reader([f.readline()]))
+        try:
+            columns = [header.index(c) for c in (id_column, email_column, password_column)]
+        except ValueError:
+            raise ValueError(f"CSV header must contain {id_column!r}, {email_column!r} and {password_column!r}; "
+                             f"got {header}")
+
+        jobs = ((lines, *columns) for lines in read_chunks(f, chunk_bytes))
+        with Pool(processes) as pool:
+            # imap keeps chunk order, so row IDs come out in file order
+            for rows, nbytes, chunk_counts, offenders in pool.imap(audit_chunk, jobs):
+                total_rows += rows
+                processed_bytes += nbytes
+                violating_rows += len(offenders)
+                counts = [a + b for a, b in zip(counts, chunk_counts)]
+                if writer:
+                    writer.writerows((row_id, "|".join(rule_names(mask))) for row_id, mask in offenders)
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    progress(total_rows, processed_bytes, file_bytes, elapsed)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "file": path,
+        "rows": total_rows,
+        "violating_rows": violating_rows,
+        "rules": {name: {"violations": count, "message": message}
+                  for (name, message), count in zip(RULES, counts)},
+        "elapsed_seconds": elapsed,
+        "rows_per_second": total_rows / elapsed if elapsed else 0.0,
+        "mb_per_second": processed_bytes / 2 ** 20 / elapsed if elapsed else 0.0,
+    }
+
+
+def print_progress(rows, done_bytes, total_bytes, elapsed):
+    sys.stderr.write(f"\r{rows:,} rows  {100 * done_bytes / max(total_bytes, 1):5.1f}%  "
+                     f"{rows / max(elapsed, 1e-9):,.0f} rows/s")
+    sys.stderr.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit stored credential records against the password policy.")
+    parser.add_argument("csv_file", help="CSV with a header row")
+    parser.add_argument("--id-column", default="id")
+    parser.add_argument("--email-column", default="email")
+    parser.add_argument("--password-column", default="password")
+    parser.add_argument("--violations", help="Write offending row IDs and broken rules to this CSV")
+    parser.add_argument("--report", help="Write the JSON summary to this file as well as stdout")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: all CPUs)")
+    parser.add_argument("--chunk-mb", type=float, default=CHUNK_BYTES / 2 ** 20, help="CSV text per worker task")
+    parser.add_argument("--quiet", action="store_true", help="No progress line")
+    args = parser.parse_args()
+
+    violations_out = open(args.violations, "w", newline="") if args.violations else None
+    try:
+        report = audit_file(args.csv_file, args.id_column, args.email_column, args.password_column,
+                            violations_out=violations_out, processes=args.processes,
+                            chunk_bytes=int(args.chunk_mb * 2 ** 20),
+                            progress=None if args.quiet else print_progress)
+    finally:
+        if violations_out:
+            violations_out.close()
+    if not args.quiet:
+        sys.stderr.write("\n")
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
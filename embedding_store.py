@@ -0,0 +1,354 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+# ----------------------------
+# Settings
+# ----------------------------
+DTYPES = ("float16", "int8")
+SCAN_CHUNK = 8192              # Rows dequantized per step during a scan (~16 MiB at 512-d)
+SIMILAR_THRESHOLD = 0.85       # Dedup verdict cut-offs, used by claim_dedup.find_duplicate
+NARRATIVE_THRESHOLD = 0.65
+
+
+class EmbeddingStore:
+    """Contiguous, memory-mapped column of claim embeddings.
+
+    Vectors are L2-normalised (so cosine similarity is a dot product) and stored
+    as float16, or as int8 with one float32 scale per row. Files on disk:
+
+        <path>.json   header: dim and dtype
+        <path>.vec    the vector matrix, row-major
+        <path>.scale  per-row scales (int8 only)
+        <path>.ids    int64 `records` rowid for each vector row
+
+    The `embedding` BLOBs in `records` stay the source of truth; `sync` rebuilds
+    whatever the files are missing from them.
+
+    Writers hold a file lock (<path>.lock), so several store objects or
+    processes can share the files. Within a process use `open_store`.
+
+    dtype=None opens an existing store as it is (float16 if new). An existing
+    store never changes dtype: asking for a different one raises ValueError;
+    delete the files to rebuild it.
+    """
+
+    def __init__(self, path, dtype=None, dim=None):
+        if dtype is not None and dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}")
+        self._requested_dtype = dtype
+        self.path = path
+        self.header_path = path + ".json"
+        self.vec_path = path + ".vec"
+        self.scale_path = path + ".scale"
+        self.ids_path = path + ".ids"
+        self.lock_path = path + ".lock"
+        self._lock = threading.Lock()
+        self.dtype, self.dim = dtype or "float16", dim
+        self._read_header()
+
+    # ----------------------------
+    # Writing
+    # ----------------------------
+    def _read_header(self):
+        if os.path.exists(self.header_path):
+            with open(self.header_path) as f:
+                header = json.load(f)
+            if self._requested_dtype not in (None, header["dtype"]):
+                raise ValueError(f"{self.path} stores {header['dtype']} vectors, not {self._requested_dtype}; "
+                                 f"delete {self.path}.* to rebuild it as {self._requested_dtype}")
+            self.dtype, self.dim = header["dtype"], header["dim"]
+
+    def _write_header(self):
+        with open(self.header_path, "w") as f:
+            json.dump({"dtype": self.dtype, "dim": self.dim}, f)
+
+    def _encode(self, vectors):
+        """Normalise and quantise a (n, dim) float32 matrix. Returns (codes, scales)."""
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+        if self.dtype == "float16":
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive write access across threads (self._lock) and processes (flock)."""
+        with self._lock, open(self.lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            # Another process may have created the store since this object was opened
+            if self.dim is None:
+                self._read_header()
+            yield
+
+    def _repair(self):
+        """Cut the files back to the rows all of them hold, dropping a torn append. Returns the row count."""
+        count = self._count()
+        if self.dim is None:
+            return count
+        sizes = [(self.vec_path, count * self.dim * np.dtype(self.dtype).itemsize), (self.ids_path, count * 8)]
+        if self.dtype == "int8":
+            sizes.append((self.scale_path, count * 4))
+        for path, size in sizes:
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+        return count
+
+    def _append(self, record_ids, embeddings):
+        """append() body; the caller holds the write lock. Returns rows written."""
+        record_ids = np.asarray(record_ids, dtype=np.int64)
+        count = self._repair()
+        if count and len(record_ids):
+            # A retried job or a concurrent sync may already have stored some of these rows
+            stored = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(count,))
+            if record_ids.min() <= stored.max():
+                keep = ~np.isin(record_ids, stored)
+                record_ids = record_ids[keep]
+                embeddings = [e for e, k in zip(embeddings, keep) if k]
+        if not len(record_ids):
+            return 0
+
+        vectors = np.vstack([np.frombuffer(e, dtype=np.float32) if isinstance(e, (bytes, memoryview)) else
+                             np.asarray(e, dtype=np.float32).reshape(-1) for e in embeddings])
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if not os.path.exists(self.header_path):
+            self._write_header()
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d embeddings, got {vectors.shape[1]}")
+
+        codes, scales = self._encode(vectors)
+        # Ids go last: a row only becomes visible once its id is written
+        with open(self.vec_path, "ab") as f:
+            f.write(codes.tobytes())
+        if scales is not None:
+            with open(self.scale_path, "ab") as f:
+                f.write(scales.tobytes())
+        with open(self.ids_path, "ab") as f:
+            f.write(record_ids.tobytes())
+        return len(record_ids)
+
+    def append(self, record_ids, embeddings):
+        """Append float32 embedding BLOBs (or arrays) for the given `records` rowids.
+
+        Rowids already in the store are skipped. Returns rows written.
+        """
+        if not len(record_ids):
+            return 0
+        with self._locked():
+            return self._append(record_ids, embeddings)
+
+    def _copy(self, cursor, batch_size):
+        added = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return added
+            added += self._append([r[0] for r in rows], [r[1] for r in rows])
+
+    def sync(self, conn, batch_size=10000, full=False):
+        """Copy embeddings of `records` rows newer than the newest stored rowid. Returns rows added.
+
+        On an empty store this is the migration from the existing BLOBs. With
+        full=True it also fills gaps below that rowid, left by a claim whose
+        append failed after a later claim had been stored.
+        """
+        with self._locked():
+            count = self._repair()
+            last_id = int(self.ids().max()) if count else 0
+            added = self._copy(conn.execute("SELECT rowid, embedding FROM records WHERE rowid > ? ORDER BY rowid",
+                                            (last_id,)), batch_size)
+            if full and count:
+                rowids = np.fromiter((r[0] for r in conn.execute("SELECT rowid FROM records WHERE rowid <= ?",
+                                                                 (last_id,))), dtype=np.int64)
+                missing = np.setdiff1d(rowids, self.ids())
+                for start in range(0, len(missing), 500):
+                    chunk = [int(i) for i in missing[start:start + 500]]
+                    added += self._copy(conn.execute(
+                        f"SELECT rowid, embedding FROM records WHERE rowid IN ({','.join('?' * len(chunk))}) "
+                        "ORDER BY rowid", chunk), batch_size)
+            return added
+
+    # ----------------------------
+    # Reading
+    # ----------------------------
+    def __len__(self):
+        return len(self.ids())
+
+    def _count(self):
+        if self.dim is None or not os.path.exists(self.ids_path):
+            return 0
+        itemsize = np.dtype(self.dtype).itemsize
+        count = min(os.path.getsize(self.ids_path) // 8, os.path.getsize(self.vec_path) // (self.dim * itemsize))
+        if self.dtype == "int8":
+            count = min(count, os.path.getsize(self.scale_path) // 4)
+        return count
+
+    def ids(self):
+        """Row-id map: the `records` rowid of every stored vector, in storage order."""
+        count = self._count()
+        if not count:
+            return np.empty(0, dtype=np.int64)
+        return np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(count,))
+
+    def _matrix(self, count):
+        codes = np.memmap(self.vec_path, dtype=self.dtype, mode="r", shape=(count, self.dim))
+        scales = np.memmap(self.scale_path, dtype=np.float32, mode="r", shape=(count,)) \
+            if self.dtype == "int8" else None
+        return codes, scales
+
+    def vectors(self, positions):
+        """Dequantised float32 rows at the given storage positions (one fancy-indexed read)."""
+        positions = np.sort(np.asarray(positions, dtype=np.int64))
+        codes, scales = self._matrix(int(positions[-1]) + 1)
+        rows = codes[positions].astype(np.float32)
+        if scales is not None:
+            rows *= scales[positions, None]
+        return rows
+
+    def iter_vectors(self, count=None):
+        """Yield the first `count` stored rows (default: all) as float32 blocks of SCAN_CHUNK rows."""
+        count = self._count() if count is None else count
+        if not count:
+            return
+        codes, scales = self._matrix(count)
+        for start in range(0, count, SCAN_CHUNK):
+            block = codes[start:start + SCAN_CHUNK].astype(np.float32)
+            if scales is not None:
+                block *= scales[start:start + SCAN_CHUNK, None]
+            yield block
+
+    def similarities(self, embedding):
+        """Cosine similarity of one float32 embedding against every stored vector."""
+        count = self._count()
+        if not count:
+            return np.empty(0, dtype=np.float32)
+        query = np.frombuffer(embedding, dtype=np.float32) if isinstance(embedding, bytes) else \
+            np.asarray(embedding, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        codes, scales = self._matrix(count)
+        sims = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCAN_CHUNK):
+            stop = min(start + SCAN_CHUNK, count)
+            sims[start:stop] = codes[start:stop].astype(np.float32) @ query
+            if scales is not None:
+                sims[start:stop] *= scales[start:stop]
+        return sims
+
+    def first_match(self, embedding, threshold=NARRATIVE_THRESHOLD):
+        """Return (rowid, similarity) of the lowest-rowid stored row above threshold, or (None, None)."""
+        sims = self.similarities(embedding)
+        hits = np.flatnonzero(sims > threshold)
+        if not len(hits):
+            return None, None
+        # Storage order is rowid order except for rows filled in by sync(full=True)
+        ids = self.ids()[:len(sims)]
+        i = int(hits[np.argmin(ids[hits])])
+        return int(ids[i]), float(sims[i])
+
+    def nbytes(self):
+        """Bytes read by one full scan."""
+        total = sum(os.path.getsize(p) for p in (self.vec_path, self.ids_path) if os.path.exists(p))
+        if self.dtype == "int8" and os.path.exists(self.scale_path):
+            total += os.path.getsize(self.scale_path)
+        return total
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(path, dtype=None):
+    """Return this process's EmbeddingStore for path, creating it on first use.
+
+    dtype=None accepts whatever the store holds; see EmbeddingStore.
+    """
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = EmbeddingStore(path, dtype=dtype)
+        store = _stores[path]
+    if dtype is not None and store.dtype != dtype:
+        raise ValueError(f"{path} is already open as {store.dtype}, not {dtype}")
+    return store
+
+
+# ----------------------------
+# Accuracy Report
+# ----------------------------
+def _verdict(sims):
+    return np.where(sims > SIMILAR_THRESHOLD, 2, np.where(sims > NARRATIVE_THRESHOLD, 1, 0))
+
+
+def measure_accuracy(conn, store, queries=200, seed=0):
+    """Compare the store's similarities with exact float32 cosine on sampled stored claims.
+
+    Reports the similarity error and how often the dedup verdict
+    (Similar Image / Same Narrative / none) differs from the exact one.
+    """
+    rows = conn.execute("SELECT rowid, embedding FROM records ORDER BY rowid").fetchall()
+    exact = np.vstack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+    exact = exact / np.linalg.norm(exact, axis=1, keepdims=True)
+    position = {rowid: i for i, (rowid, _) in enumerate(rows)}
+    order = np.array([position[int(rowid)] for rowid in store.ids()])
+    exact = exact[order]
+
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(exact), min(queries, len(exact)), replace=False)
+    errors, flips, pairs = [], 0, 0
+    for i in picks:
+        true_sims = exact @ exact[i]
+        approx_sims = store.similarities(exact[i])
+        errors.append(np.abs(true_sims - approx_sims))
+        flips += int(np.count_nonzero(_verdict(true_sims) != _verdict(approx_sims)))
+        pairs += len(true_sims)
+    errors = np.concatenate(errors)
+    blob_bytes = conn.execute("SELECT SUM(LENGTH(embedding)) FROM records").fetchone()[0] or 0
+    return {
+        "dtype": store.dtype,
+        "rows": len(store),
+        "queries": len(picks),
+        "mean_abs_error": float(errors.mean()),
+        "max_abs_error": float(errors.max()),
+        "verdict_flip_rate": flips / pairs,
+        "store_bytes": store.nbytes(),
+        "blob_bytes": int(blob_bytes),
+    }
+
+
+# ----------------------------
+# Migration CLI
+# ----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Migrate claim embedding BLOBs into a compact memory-mapped store.")
+    parser.add_argument("db", nargs="?", default="claims.db")
+    parser.add_argument("--store", default="claims_embeddings", help="Store path prefix")
+    parser.add_argument("--dtype", choices=DTYPES, default=None,
+                        help="Vector dtype for a new store (default: float16); must match an existing one")
+    parser.add_argument("--queries", type=int, default=200, help="Sampled queries for the accuracy report")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    store = EmbeddingStore(args.store, dtype=args.dtype)
+    print(f"Migrated {store.sync(conn, full=True)} embeddings into {args.store}.vec ({store.dtype})")
+    if len(store):
+        print(json.dumps(measure_accuracy(conn, store, args.queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField, FloatField, SelectField, DateField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional
+from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField, FloatField, SelectField, DateField, SelectMultipleField
+from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, ValidationError
 from flask_wtf.file import FileField, FileAllowed
 
 class LoginForm(FlaskForm):
@@ -39,4 +39,29 @@ class AttendanceForm(FlaskForm):
         ('Maternity', 'Maternity Leave')
         # 'Present' is the default, so we only log exceptions
     ], validators=[DataRequired()])
-    submit = SubmitField('Add Leave')
\ No newline at end of file
+    submit = SubmitField('Add Leave')
+
+class BulkAttendanceForm(FlaskForm):
+    """Form to log one leave type for several employees over a date range."""
+    MAX_DAYS = 366
+
+    # Choices are filled in by the view with the manager's own employees
+    employee_ids = SelectMultipleField('Employees', coerce=int, validators=[DataRequired()])
+    start_date = DateField('From', format='%Y-%m-%d', validators=[DataRequired()])
+    end_date = DateField('To', format='%Y-%m-%d', validators=[DataRequired()])
+    leave_type = SelectField('Leave Type', choices=[
+        ('Present', 'Present'),
+        ('Annual', 'Annual Leave'),
+        ('Casual', 'Casual Leave'),
+        ('Sick', 'Sick Leave'),
+        ('Maternity', 'Maternity Leave')
+    ], validators=[DataRequired()])
+    skip_weekends = BooleanField('Skip weekends', default=True)
+    submit = SubmitField('Save Attendance')
+
+    def validate_end_date(self, field):
+        if self.start_date.data and field.data:
+            if field.data < self.start_date.data:
+                raise ValidationError('End date must be on or after the start date.')
+            if (field.data - self.start_date.data).days >= self.MAX_DAYS:
+                raise ValidationError(f'Date range cannot exceed {self.MAX_DAYS} days.')
\ No newline at end of file
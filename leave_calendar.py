@@ -0,0 +1,149 @@
+# leave_calendar.py
+import bisect
+from datetime import date, timedelta
+
+# Leaves in these states occupy the calendar; rejected ones do not.
+ACTIVE_STATUSES = ("Pending", "Approve")
+
+
+# ---------- INDEXES ----------
+def init_indexes(conn):
+    """Indexes that turn leave overlap lookups into bounded range scans."""
+    cur = conn.cursor()
+    # Per-employee overlap checks at apply time
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leaves_emp_start ON leaves (emp_id, start_date, end_date)")
+    # Calendar-wide "who is out" queries
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leaves_start_end ON leaves (start_date, end_date)")
+    # Makes MAX(duration) an index lookup; see max_leave_days()
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leaves_duration ON leaves ((julianday(end_date) - julianday(start_date)))")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_employees_manager ON employees (manager_emp_id)")
+    conn.commit()
+
+
+def max_leave_days(conn):
+    """Length in days of the longest stored leave (0 if none)."""
+    r = conn.execute("SELECT MAX(julianday(end_date) - julianday(start_date)) FROM leaves").fetchone()
+    return int(r[0] or 0)
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+# ---------- OVERLAP CHECK ----------
+def find_overlaps(conn, emp_id, start_str, end_str):
+    """Active leaves of emp_id that share at least one day with [start_str, end_str]."""
+    placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+    return conn.execute(f"""SELECT * FROM leaves
+                            WHERE emp_id=? AND start_date <= ? AND end_date >= ?
+                              AND status IN ({placeholders})
+                            ORDER BY start_date""",
+                        (emp_id, end_str, start_str) + ACTIVE_STATUSES).fetchall()
+
+
+# ---------- RANGE QUERIES ----------
+def team_leaves(conn, manager_emp_id, start_str, end_str):
+    """Active leaves of a manager's direct reports overlapping [start_str, end_str].
+
+    A leave overlapping the window must start no earlier than the window start
+    minus the longest leave on record, so the start_date index is only scanned
+    over that bounded range instead of the whole history.
+    """
+    lower = (_as_date(start_str) - timedelta(days=max_leave_days(conn))).isoformat()
+    placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+    return conn.execute(f"""SELECT l.* FROM leaves l
+                            JOIN employees e ON e.emp_id = l.emp_id
+                            WHERE e.manager_emp_id = ?
+                              AND l.start_date BETWEEN ? AND ?
+                              AND l.end_date >= ?
+                              AND l.status IN ({placeholders})""",
+                        (manager_emp_id, lower, end_str, start_str) + ACTIVE_STATUSES).fetchall()
+
+
+class LeaveIndex:
+    """Sorted-endpoint interval index over leave rows.
+
+    Leaves are kept sorted by start day next to the longest duration, so a point
+    or range lookup is a bisect over [start - max_days, end] plus an end check.
+    """
+
+    def __init__(self, rows):
+        # Keyed on the days only: rows with equal intervals must not be compared
+        items = sorted(((_as_date(r["start_date"]).toordinal(), _as_date(r["end_date"]).toordinal(), dict(r))
+                        for r in rows), key=lambda item: item[:2])
+        self.starts = [s for s, _, _ in items]
+        self.ends = [e for _, e, _ in items]
+        self.rows = [row for _, _, row in items]
+        self.max_days = max((e - s for s, e in zip(self.starts, self.ends)), default=0)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def overlapping(self, start, end=None):
+        """Leave rows covering any day in [start, end] (a single day if end is omitted)."""
+        lo_day = _as_date(start).toordinal()
+        hi_day = _as_date(end).toordinal() if end is not None else lo_day
+        lo = bisect.bisect_left(self.starts, lo_day - self.max_days)
+        hi = bisect.bisect_right(self.starts, hi_day)
+        return [self.rows[i] for i in range(lo, hi) if self.ends[i] >= lo_day]
+
+    def who_is_out(self, day):
+        """emp_ids on leave on a single day."""
+        return sorted({row["emp_id"] for row in self.overlapping(day)})
+
+    def daily_out_counts(self, start, end):
+        """Number of people out on each day of [start, end], via a difference array."""
+        first, last = _as_date(start).toordinal(), _as_date(end).toordinal()
+        n_days = last - first + 1
+        spans = {}
+        for row in self.overlapping(start, end):
+            a = max(_as_date(row["start_date"]).toordinal(), first) - first
+            b = min(_as_date(row["end_date"]).toordinal(), last) - first
+            spans.setdefault(row["emp_id"], []).append((a, b))
+
+        diff = [0] * (n_days + 1)
+        for emp_spans in spans.values():
+            # Merge per person first: overlaps stored before apply-time checks
+            # existed must not count someone twice
+            emp_spans.sort()
+            cur_a, cur_b = emp_spans[0]
+            for a, b in emp_spans[1:] + [(n_days + 1, n_days + 1)]:
+                if a > cur_b + 1:
+                    diff[cur_a] += 1
+                    diff[cur_b + 1] -= 1
+                    cur_a, cur_b = a, b
+                else:
+                    cur_b = max(cur_b, b)
+        counts, running = [], 0
+        for i in range(n_days):
+            running += diff[i]
+            counts.append(running)
+        return {date.fromordinal(first + i): counts[i] for i in range(n_days)}
+
+
+def build_team_index(conn, manager_emp_id, start_str, end_str):
+    """LeaveIndex over a manager's team for one window."""
+    return LeaveIndex(team_leaves(conn, manager_emp_id, start_str, end_str))
+
+
+# ---------- HEATMAP ----------
+def coverage_matrix(conn, manager_emp_id, start_str, end_str):
+    """Team coverage heatmap data: (days, {emp_id: [cell per day]}, out counts per day).
+
+    Each cell is "" when the employee is available, otherwise the leave row
+    (leave_type and status) covering that day.
+    """
+    start, end = _as_date(start_str), _as_date(end_str)
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    team = [r["emp_id"] for r in conn.execute(
+        "SELECT emp_id FROM employees WHERE manager_emp_id=? ORDER BY name", (manager_emp_id,)).fetchall()]
+    index = build_team_index(conn, manager_emp_id, start.isoformat(), end.isoformat())
+
+    cells = {emp_id: [""] * len(days) for emp_id in team}
+    for row in index.overlapping(start, end):
+        a = max(_as_date(row["start_date"]), start)
+        b = min(_as_date(row["end_date"]), end)
+        for i in range((a - start).days, (b - start).days + 1):
+            if row["emp_id"] in cells and not cells[row["emp_id"]][i]:
+                cells[row["emp_id"]][i] = row
+    return days, cells, index.daily_out_counts(start, end)
@@ -3,6 +3,15 @@ from flask_login import UserMixin
 from datetime import datetime
 
 
+def dialect_insert(table):
+    """Returns an INSERT for table that supports on_conflict_do_update (SQLite or PostgreSQL)."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
 @login_manager.user_loader
 def load_user(user_id):
     """Required by Flask-Login to load the current user."""
@@ -81,6 +90,10 @@ class Project(db.Model):
 class Attendance(db.Model):
     """Database model for Attendance/Leave."""
     __tablename__ = 'attendance'
+    # One record per employee per day; also the conflict target for bulk upserts
+    __table_args__ = (
+        db.Index('uq_attendance_employee_date', 'employee_id', 'date', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False)
@@ -93,4 +106,21 @@ class Attendance(db.Model):
     employee = db.relationship('Employee', back_populates='attendance_records')
 
     def __repr__(self):
-        return f'<Attendance {self.employee.name} - {self.date} - {self.leave_type}>'
\ No newline at end of file
+        return f'<Attendance {self.employee.name} - {self.date} - {self.leave_type}>'
+
+
+class PageVersion(db.Model):
+    """Change counter for a cached page, shared by every app process.
+
+    scope is 'manager' (dashboard) or 'employee' (detail page) and key the
+    matching id. Rows are never deleted, so a reused id can't revive old ETags.
+    """
+    __tablename__ = 'page_version'
+
+    scope = db.Column(db.String(20), primary_key=True)
+    key = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    modified_at = db.Column(db.DateTime, nullable=False)  # UTC
+
+    def __repr__(self):
+        return f'<PageVersion {self.scope} {self.key} v{self.version}>'
@@ -1,9 +1,9 @@
-from flask import render_template, redirect, url_for, flash, request, Blueprint, abort
+from flask import render_template, redirect, url_for, flash, request, Blueprint, abort, make_response
 from flask_login import login_user, current_user, logout_user, login_required
-from . import db, bcrypt
-from .models import User, Employee, Project, Attendance
-from .forms import LoginForm, EmployeeForm, ProjectForm, AttendanceForm
-from datetime import datetime
+from . import db, bcrypt, caching
+from .models import User, Employee, Project, Attendance, dialect_insert
+from .forms import LoginForm, EmployeeForm, ProjectForm, AttendanceForm, BulkAttendanceForm
+from datetime import datetime, timezone, timedelta
 import calendar
 import os
 import secrets
@@ -57,6 +57,29 @@ def get_calendar_data(year, month, records):
 
     return calendar_data
 
+def attendance_dates(start_date, end_date, skip_weekends=True):
+    """Lists every date in [start_date, end_date], optionally without Saturdays and Sundays."""
+    days = (start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1))
+    return [day for day in days if not (skip_weekends and day.weekday() >= 5)]
+
+
+def upsert_attendance(employee_ids, dates, leave_type):
+    """Writes one leave type for every (employee, date) pair in a single executemany upsert.
+
+    Relies on the unique (employee_id, date) index on Attendance. The caller commits.
+    Returns the number of rows written.
+    """
+    rows = [{'employee_id': employee_id, 'date': day, 'leave_type': leave_type}
+            for employee_id in employee_ids for day in dates]
+    if not rows:
+        return 0
+
+    stmt = dialect_insert(Attendance.__table__)
+    stmt = stmt.on_conflict_do_update(index_elements=['employee_id', 'date'],
+                                      set_={'leave_type': stmt.excluded.leave_type})
+    db.session.execute(stmt, rows)
+    return len(rows)
+
 def save_picture(form_picture):
     """Saves uploaded picture to the static folder with a secure name."""
     # Create a random, secure filename
@@ -109,9 +132,21 @@ def logout():
 @login_required
 def dashboard():
     """Dashboard page showing all employees under the logged-in manager."""
+    # Answer revalidation from the version counters alone, before touching the DB
+    version, modified = caching.manager_version(current_user.id)
+    etag = caching.make_etag('dashboard', current_user.id, version)
+    last_modified = caching.last_modified(modified)
+    not_modified = caching.conditional_response(etag, last_modified)
+    if not_modified:
+        return not_modified
+
     employees = Employee.query.filter_by(manager_id=current_user.id).order_by(Employee.name).all()
     form = EmployeeForm()  # For the 'Add Employee' modal/form
-    return render_template('dashboard.html', title='Dashboard', employees=employees, form=form)
+    bulk_form = BulkAttendanceForm()  # For the team attendance form
+    bulk_form.employee_ids.choices = [(employee.id, employee.name) for employee in employees]
+    response = make_response(render_template('dashboard.html', title='Dashboard', employees=employees, form=form,
+                                             bulk_form=bulk_form))
+    return caching.add_validators(response, etag, last_modified)
 
 
 @main_bp.route('/employee/add', methods=['POST'])
@@ -136,6 +171,7 @@ def add_employee():
             manager_id=current_user.id
         )
         db.session.add(new_employee)
+        caching.bump_manager(current_user.id)
         db.session.commit()
         flash(f'Employee {new_employee.name} has been added!', 'success')
     else:
@@ -176,21 +212,48 @@ def employee_detail(employee_id):
         'today': url_for('main.employee_detail', employee_id=employee_id)
     }
 
-    attendance_records = employee.attendance_records.all()
-    calendar_data = get_calendar_data(view_year, view_month, attendance_records)
-    # --- End Calendar ---
+    # The calendar highlights today and past weekdays, so the page also changes at midnight
+    today_date = today.date()
+    version, modified = caching.employee_version(employee_id)
+    etag = caching.make_etag('employee', employee_id, version, view_year, view_month, today_date)
+    last_modified = caching.last_modified(modified,
+                                          datetime(today.year, today.month, today.day, tzinfo=timezone.utc))
+    not_modified = caching.conditional_response(etag, last_modified)
+    if not_modified:
+        return not_modified
 
     # Forms for this page
     project_form = ProjectForm()
     attendance_form = AttendanceForm()
 
-    return render_template('employee_detail.html',
-                           title=employee.name,
-                           employee=employee,
-                           project_form=project_form,
-                           attendance_form=attendance_form,
-                           calendar_data=calendar_data,
-                           nav_urls=nav_urls)
+    def render_calendar():
+        attendance_records = employee.attendance_records.all()
+        calendar_data = get_calendar_data(view_year, view_month, attendance_records)
+        return render_template('_calendar_grid.html', calendar_data=calendar_data)
+
+    def render_projects():
+        return render_template('_project_list.html', employee=employee, project_form=project_form)
+
+    calendar_grid = caching.fragment_cache.render(
+        ('calendar', employee_id, version, view_year, view_month, today_date), render_calendar)
+    # The project list embeds CSRF tokens, so it is also keyed like the page ETag
+    project_list = caching.fragment_cache.render(
+        ('projects', employee_id, version, caching.make_etag()), render_projects)
+    # --- End Calendar ---
+
+    # Only the nav header is rendered outside the (possibly cached) grid
+    calendar_data = {'month_name': datetime(view_year, view_month, 1).strftime('%B %Y')}
+
+    response = make_response(render_template('employee_detail.html',
+                                             title=employee.name,
+                                             employee=employee,
+                                             project_form=project_form,
+                                             attendance_form=attendance_form,
+                                             calendar_data=calendar_data,
+                                             calendar_grid=calendar_grid,
+                                             project_list=project_list,
+                                             nav_urls=nav_urls))
+    return caching.add_validators(response, etag, last_modified)
 
 
 @main_bp.route('/employee/<int:employee_id>/edit', methods=['POST'])
@@ -207,6 +270,8 @@ def edit_employee(employee_id):
         employee.employee_login = form.employee_login.data
         employee.email = form.email.data
         employee.photo_url = form.photo_url.data or employee.photo_url
+        caching.bump_manager(current_user.id)
+        caching.bump_employee(employee.id)
         db.session.commit()
         flash('Employee details updated!', 'success')
     else:
@@ -224,6 +289,8 @@ def delete_employee(employee_id):
         abort(403)
 
     db.session.delete(employee)
+    caching.bump_manager(current_user.id)
+    caching.bump_employee(employee_id)
     db.session.commit()
     flash(f'Employee {employee.name} has been deleted.', 'success')
     return redirect(url_for('main.dashboard'))
@@ -252,6 +319,7 @@ def add_project(employee_id):
             employee_id=employee.id
         )
         db.session.add(new_project)
+        caching.bump_employee(employee.id)
         db.session.commit()
         flash('New project added!', 'success')
     else:
@@ -277,6 +345,7 @@ def edit_project(project_id):
         project.impact_usd = form.impact_usd.data
         project.stakeholder_login = form.stakeholder_login.data
         project.status = form.status.data
+        caching.bump_employee(project.employee_id)
         db.session.commit()
         flash(f'Project "{project.title}" updated!', 'success')
     else:
@@ -295,6 +364,7 @@ def delete_project(project_id):
 
     employee_id = project.employee_id
     db.session.delete(project)
+    caching.bump_employee(employee_id)
     db.session.commit()
     flash(f'Project "{project.title}" has been deleted.', 'success')
     return redirect(url_for('main.employee_detail', employee_id=employee_id))
@@ -330,8 +400,32 @@ def add_attendance(employee_id):
             db.session.add(new_record)
             flash('Leave record added.', 'success')
 
+        caching.bump_employee(employee_id)
         db.session.commit()
     else:
         flash('Error adding leave record.', 'danger')
 
-    return redirect(url_for('main.employee_detail', employee_id=employee_id))
\ No newline at end of file
+    return redirect(url_for('main.employee_detail', employee_id=employee_id))
+
+
+@main_bp.route('/attendance/bulk', methods=['POST'])
+@login_required
+def bulk_attendance():
+    """Handles logging a date range of attendance for several employees at once."""
+    form = BulkAttendanceForm()
+    # Only the manager's own employees are valid choices
+    form.employee_ids.choices = [(employee.id, employee.name) for employee in
+                                 Employee.query.filter_by(manager_id=current_user.id).all()]
+
+    if form.validate_on_submit():
+        dates = attendance_dates(form.start_date.data, form.end_date.data, form.skip_weekends.data)
+        count = upsert_attendance(form.employee_ids.data, dates, form.leave_type.data)
+        for employee_id in form.employee_ids.data:
+            caching.bump_employee(employee_id)
+        db.session.commit()
+        flash(f'{count} attendance records saved for {len(form.employee_ids.data)} employee(s).', 'success')
+    else:
+        errors = [error for field_errors in form.errors.values() for error in field_errors]
+        flash('Error saving attendance. ' + ' '.join(errors), 'danger')
+
+    return redirect(url_for('main.dashboard'))
\ No newline at end of file
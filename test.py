@@ -8,6 +8,14 @@ import numpy as np
 import os
 import pandas as pd
 import uuid
+import io
+import time
+from contextlib import closing
+
+import claim_clustering
+import claim_dedup
+import claim_jobs
+from embedding_store import open_store
 
 # ----------------------------
 # Device & CLIP Setup
@@ -15,34 +23,61 @@ import uuid
 device = "cuda" if torch.cuda.is_available() else "cpu"
 clip_model_path = os.path.abspath("./clip_model_offline")  # Offline CLIP folder
 
-model = CLIPModel.from_pretrained(clip_model_path, local_files_only=True).to(device)
-processor = CLIPProcessor.from_pretrained(clip_model_path, local_files_only=True)
+@st.cache_resource
+def load_clip():
+    """Load CLIP once per process instead of on every rerun"""
+    clip_model = CLIPModel.from_pretrained(clip_model_path, local_files_only=True).to(device)
+    clip_processor = CLIPProcessor.from_pretrained(clip_model_path, local_files_only=True)
+    return clip_model, clip_processor
+
+model, processor = load_clip()
 
 # ----------------------------
 # Database Setup
 # ----------------------------
 DB_FILE = "claims.db"
 IMAGE_FOLDER = "./images"
-
-os.makedirs(IMAGE_FOLDER, exist_ok=True)
-
-conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+EMBEDDING_STORE_PATH = "claims_embeddings"  # Memory-mapped vector column used by the dedup scan
+EMBEDDING_DTYPE = "float16"                 # "float16" (2x smaller) or "int8" (~4x smaller); delete
+                                            # claims_embeddings.* after changing it, the store is rebuilt
+CLAIM_WORKERS = 2                           # Background threads processing queued claims
+CLAIM_BATCH_SIZE = 8                        # Claims embedded per CLIP forward pass
+CLUSTERS_PER_PAGE = 50                      # Cluster Viewer page size
+CLUSTER_MEMBER_LIMIT = 200                  # Claims shown for the selected cluster
+JOB_POLL_SECONDS = 1                        # How often the Submit Claim page refreshes pending jobs
+
+@st.cache_resource
+def init_database():
+    """Create the image folder and tables once per process"""
+    os.makedirs(IMAGE_FOLDER, exist_ok=True)
+    with closing(sqlite3.connect(DB_FILE)) as db:
+        claim_dedup.init_records_table(db)
+        claim_clustering.init_tables(db)
+        claim_jobs.init_tables(db)
+
+init_database()
+
+# One connection per browser session, reused across its reruns
+if "conn" not in st.session_state:
+    st.session_state.conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+conn = st.session_state.conn
 c = conn.cursor()
 
-# Create table if not exists with damage_class column
-c.execute("""
-CREATE TABLE IF NOT EXISTS records (
-    unique_image_id TEXT,
-    customer_id TEXT,
-    order_id TEXT,
-    marketplace TEXT,
-    description TEXT,
-    damage_class TEXT,
-    image_hash TEXT,
-    embedding BLOB
-)
-""")
-conn.commit()
+@st.cache_resource
+def load_embedding_store():
+    """One store per process, shared by reruns and the claim workers.
+    The first load migrates every stored BLOB and fills any gaps"""
+    store = open_store(EMBEDDING_STORE_PATH, dtype=EMBEDDING_DTYPE)
+    with closing(sqlite3.connect(DB_FILE)) as db:
+        store.sync(db, full=True)
+        # Cluster claims stored before clustering existed now, not after RECLUSTER_EVERY new ones
+        if claim_clustering.needs_seeding(db, len(store)):
+            claim_clustering.maybe_recluster(DB_FILE, EMBEDDING_STORE_PATH, force=True)
+    return store
+
+# The workers append every claim they store; rows written outside this app
+# are picked up by the next process start or re-cluster
+embedding_store = load_embedding_store()
 
 # ----------------------------
 # Utility Functions
@@ -59,58 +94,110 @@ def save_image(image, image_hash):
     image.save(path)
     return path
 
-def get_embedding(image, description):
-    inputs = processor(text=[description], images=image, return_tensors="pt", padding=True)
+def get_embeddings(images, descriptions):
+    """Embed a batch of (image, description) pairs in one CLIP forward pass"""
+    inputs = processor(text=list(descriptions), images=list(images), return_tensors="pt", padding=True)
     pixel_values = inputs["pixel_values"].to(device)
     input_ids = inputs["input_ids"].to(device)
+    attention_mask = inputs["attention_mask"].to(device)
 
     with torch.no_grad():
         image_embeds = model.get_image_features(pixel_values)
-        text_embeds = model.get_text_features(input_ids)
+        text_embeds = model.get_text_features(input_ids, attention_mask=attention_mask)
 
     combined = (0.4 * image_embeds + 0.6 * text_embeds).cpu().numpy().astype(np.float32)
-    return combined.tobytes()
+    return [row.tobytes() for row in combined]
 
-def cosine_similarity(a, b):
-    a, b = np.frombuffer(a, dtype=np.float32), np.frombuffer(b, dtype=np.float32)
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+def get_embedding(image, description):
+    return get_embeddings([image], [description])[0]
 
 def check_duplicates(image, description):
     image_hash = get_image_hash(image)
     new_embedding = get_embedding(image, description)
+    return claim_dedup.find_duplicate(c, embedding_store, image_hash, new_embedding)
 
-    c.execute("SELECT * FROM records")
-    all_records = c.fetchall()
-
-    for rec in all_records:
-        uid, _, _, _, _, _, stored_hash, stored_emb = rec
-
-        if stored_hash == image_hash:
-            return ("Exact Duplicate", uid)
-
-        sim = cosine_similarity(new_embedding, stored_emb)
-        if sim > 0.85:
-            return ("Similar Image", uid)
-        if sim > 0.65:
-            return ("Same Narrative", uid)
-
-    return ("No Duplicate", None)
+def store_record(db, unique_image_id, customer_id, order_id, marketplace, description, damage_class,
+                 image, image_hash, embedding):
+    """Insert an already hashed and embedded claim through the given connection"""
+    save_image(image, image_hash)
+    record_id = claim_dedup.insert_record(db, unique_image_id, customer_id, order_id, marketplace, description,
+                                          damage_class, image_hash, embedding)
+    db.commit()
+    return claim_dedup.index_record(db, embedding_store, DB_FILE, record_id, embedding)
 
 def save_to_db(unique_image_id, customer_id, order_id, marketplace, description, damage_class, image):
     image_hash = get_image_hash(image)
-    save_image(image, image_hash)
     embedding = get_embedding(image, description)
-    c.execute(
-        "INSERT INTO records VALUES (?,?,?,?,?,?,?,?)",
-        (unique_image_id, customer_id, order_id, marketplace, description, damage_class, image_hash, embedding)
-    )
-    conn.commit()
+    return store_record(conn, unique_image_id, customer_id, order_id, marketplace, description, damage_class,
+                        image, image_hash, embedding)
+
+# ----------------------------
+# Background Claim Processing
+# ----------------------------
+def process_claim_batch(db, jobs):
+    """Worker entry point: decode and hash each queued claim, embed the batch together,
+    then dedup and store the claims one at a time in job order"""
+    results, ready = {}, []
+    for job in jobs:
+        timings = {}
+        try:
+            start = time.perf_counter()
+            image = Image.open(io.BytesIO(job["image_bytes"])).convert("RGB")
+            timings["decode"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            image_hash = get_image_hash(image)
+            timings["phash"] = time.perf_counter() - start
+            ready.append((job, image, image_hash, timings))
+        except Exception as e:
+            results[job["job_id"]] = f"{type(e).__name__}: {e}"
+
+    if not ready:
+        return results
+
+    start = time.perf_counter()
+    embeddings = get_embeddings([r[1] for r in ready], [r[0]["description"] for r in ready])
+    embed_time = time.perf_counter() - start
+
+    for (job, image, image_hash, timings), embedding in zip(ready, embeddings):
+        timings["embed"] = embed_time
+        try:
+            # Serialised so each claim is checked against every claim stored before it
+            with claim_jobs.DEDUP_LOCK:
+                if job["record_id"] is None:
+                    start = time.perf_counter()
+                    status, matched_uid = claim_dedup.find_duplicate(db.cursor(), embedding_store, image_hash, embedding)
+                    timings["dedup"] = time.perf_counter() - start
+
+                    uid = matched_uid or generate_unique_image_id()
+                    start = time.perf_counter()
+                    save_image(image, image_hash)
+                    record_id = claim_dedup.insert_record(db, uid, job["customer_id"], job["order_id"],
+                                                          job["marketplace"], job["description"], job["damage_class"],
+                                                          image_hash, embedding)
+                    # Committed together, so a retry never inserts the claim twice
+                    claim_jobs.link_record(db, job["job_id"], record_id, status, uid)
+                    db.commit()
+                else:
+                    # An earlier attempt stored the claim but failed while indexing it
+                    record_id, status, uid = job["record_id"], job["verdict"], job["unique_image_id"]
+                    start = time.perf_counter()
+                claim_dedup.index_record(db, embedding_store, DB_FILE, record_id, embedding)
+                timings["save"] = time.perf_counter() - start
+            results[job["job_id"]] = (status, uid, timings)
+        except Exception as e:
+            # Don't let fail() commit half of this claim's writes
+            db.rollback()
+            results[job["job_id"]] = f"{type(e).__name__}: {e}"
+    return results
+
+claim_jobs.start_workers(DB_FILE, process_claim_batch, workers=CLAIM_WORKERS, batch_size=CLAIM_BATCH_SIZE)
 
 # ----------------------------
 # Streamlit UI
 # ----------------------------
 st.sidebar.title("📌 Navigation")
-menu = st.sidebar.radio("Go to:", ["Submit Claim", "Database Viewer"])
+menu = st.sidebar.radio("Go to:", ["Submit Claim", "Database Viewer", "Cluster Viewer", "Queue Metrics"])
 st.title("Duplicate Image detection and Clustering")
 
 # ----------------------------
@@ -130,19 +217,33 @@ if menu == "Submit Claim":
 
     uploaded_file = st.file_uploader("Upload Image", type=["png", "jpg", "jpeg"])
 
+    if "claim_job_ids" not in st.session_state:
+        st.session_state.claim_job_ids = []
+
     if uploaded_file and st.button("Check for Duplicates"):
-        image_input = Image.open(uploaded_file).convert("RGB")
-        status, matched_uid = check_duplicates(image_input, description_input)
-
-        if status == "No Duplicate":
-            new_uid = generate_unique_image_id()
-            save_to_db(new_uid, customer_id_input, order_id_input, marketplace_input,
-                       description_input, damage_input, image_input)
-            st.success(f"✅ No duplicate found. Stored under Unique Image ID: {new_uid}")
-        else:
-            save_to_db(matched_uid, customer_id_input, order_id_input, marketplace_input,
-                       description_input, damage_input, image_input)
-            st.warning(f"⚠️ {status} found! Claim linked to existing Unique Image ID: {matched_uid}")
+        job_id = claim_jobs.enqueue(conn, customer_id_input, order_id_input, marketplace_input,
+                                    description_input, damage_input, uploaded_file.getvalue())
+        st.session_state.claim_job_ids.insert(0, job_id)
+        st.info(f"📨 Claim queued as job {job_id}. The verdict will appear below.")
+
+    # Poll the queue for this session's recent submissions; only this block re-runs
+    @st.fragment(run_every=JOB_POLL_SECONDS)
+    def show_claim_jobs():
+        for job_id in st.session_state.claim_job_ids[:10]:
+            job = claim_jobs.get_job(conn, job_id)
+            if job is None:
+                continue
+            if job["status"] == "done":
+                if job["verdict"] == "No Duplicate":
+                    st.success(f"✅ Job {job_id}: No duplicate found. Stored under Unique Image ID: {job['unique_image_id']}")
+                else:
+                    st.warning(f"⚠️ Job {job_id}: {job['verdict']} found! Claim linked to existing Unique Image ID: {job['unique_image_id']}")
+            elif job["status"] == "failed":
+                st.error(f"❌ Job {job_id} failed after {job['attempts']} attempts: {job['error'].strip().splitlines()[-1]}")
+            else:
+                st.info(f"⏳ Job {job_id} is {job['status']} (attempt {max(job['attempts'], 1)} of {claim_jobs.MAX_ATTEMPTS})")
+
+    show_claim_jobs()
 
 # ----------------------------
 # Database Viewer
@@ -187,5 +288,64 @@ elif menu == "Database Viewer":
             col6.image(image_path, width=60)
         else:
             col6.write("No image")
+
+# ----------------------------
+# Cluster Viewer
+# ----------------------------
+elif menu == "Cluster Viewer":
+    st.subheader("🧩 Claim Clusters")
+
+    if st.button("Re-cluster now"):
+        if claim_clustering.maybe_recluster(DB_FILE, EMBEDDING_STORE_PATH, force=True):
+            st.success("Re-clustering started in the background; refresh to see the new clusters")
+        else:
+            st.info("A re-clustering is already running")
+    elif claim_clustering.recluster_running():
+        st.info("Re-clustering in the background...")
+
+    total = claim_clustering.count_clusters(conn)
+    if total:
+        pages = (total + CLUSTERS_PER_PAGE - 1) // CLUSTERS_PER_PAGE
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+        clusters = claim_clustering.list_clusters(conn, CLUSTERS_PER_PAGE, (page - 1) * CLUSTERS_PER_PAGE)
+        st.write(f"{total} clusters, largest first")
+        st.dataframe(pd.DataFrame(clusters, columns=["Cluster", "Claims"]))
+
+        # Members and thumbnails are only loaded for the selected cluster
+        sizes = dict(clusters)
+        cluster_id = st.selectbox("Show cluster", list(sizes),
+                                  format_func=lambda cid: f"Cluster {cid} — {sizes[cid]} claims")
+        members = claim_clustering.cluster_members(conn, cluster_id, CLUSTER_MEMBER_LIMIT)
+        df = pd.DataFrame(members, columns=[
+            "Unique Image ID", "Customer ID", "Order ID", "Marketplace", "Description", "Damage", "Image Hash"
+        ])
+        if sizes[cluster_id] > len(members):
+            st.caption(f"Showing the first {len(members)} of {sizes[cluster_id]} claims")
+        st.dataframe(df)
+
+        thumbs = [os.path.join(IMAGE_FOLDER, f"{h}.png") for h in df["Image Hash"].unique()[:8]]
+        thumbs = [path for path in thumbs if os.path.exists(path)]
+        if thumbs:
+            st.image(thumbs, width=60)
+    else:
+        st.info("No clusters yet. Submit claims to build them.")
+
+# ----------------------------
+# Queue Metrics
+# ----------------------------
+elif menu == "Queue Metrics":
+    st.subheader("📊 Claim Queue")
+
+    metrics = claim_jobs.queue_metrics(conn)
+    cols = st.columns(4)
+    for col, (status, count) in zip(cols, metrics["depth"].items()):
+        col.metric(status.capitalize(), count)
+
+    if metrics["latency"]:
+        st.markdown("**Per-stage latency (seconds, recent jobs)**")
+        latency_df = pd.DataFrame(metrics["latency"]).T[["count", "mean", "p50", "p95"]]
+        st.dataframe(latency_df)
+    else:
+        st.info("No completed jobs yet.")
 else:
     st.info("No records found in database.")
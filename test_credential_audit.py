@@ -0,0 +1,34 @@
+import unittest
+
+import credential_audit
+from credential_audit import PASSWORD_CASE, check
+
+
+def source_case_rule(password):
+    """The uppercase/lowercase test from "conditional statement challenge.py"."""
+    return not (any(char.isupper() for char in password) and any(char.islower() for char in password))
+
+
+class PasswordCaseTest(unittest.TestCase):
+
+    def test_matches_source_rule(self):
+        passwords = ["Abcdefg1", "abcdefg1", "ABCDEFG1", "12345678",
+                     "ABCDEFGª1",   # ª is lowercase but has no uppercase form
+                     "ǅaaaaaaa1",   # ǅ is titlecase: neither isupper() nor islower()
+                     "ßTRASSE12", "Σίσυφος12", "ǈUDEVIT12"]
+        for password in passwords:
+            with self.subTest(password=password):
+                self.assertEqual(bool(check("user@gmail.com", password) & PASSWORD_CASE),
+                                 source_case_rule(password))
+
+    def test_valid_record(self):
+        self.assertEqual(check("user@gmail.com", "Abcdefg1"), 0)
+
+    def test_rule_names(self):
+        mask = check("user @example.com", "short")
+        self.assertEqual(credential_audit.rule_names(mask),
+                         ["email_spaces", "password_length", "password_case", "email_domain"])
+
+
+if __name__ == "__main__":
+    unittest.main()
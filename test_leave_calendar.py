@@ -0,0 +1,95 @@
+import random
+import sqlite3
+import unittest
+from datetime import date, timedelta
+
+import leave_calendar
+from leave_calendar import LeaveIndex
+
+
+def leave(emp_id, start, end, leave_type="Annual", status="Approve"):
+    return {"emp_id": emp_id, "start_date": start, "end_date": end, "leave_type": leave_type, "status": status}
+
+
+def brute_force_counts(rows, start, end):
+    """People out per day by checking every leave against every day."""
+    start, end = date.fromisoformat(start), date.fromisoformat(end)
+    counts = {}
+    for i in range((end - start).days + 1):
+        day = (start + timedelta(days=i)).isoformat()
+        counts[start + timedelta(days=i)] = len({r["emp_id"] for r in rows if r["start_date"] <= day <= r["end_date"]})
+    return counts
+
+
+class LeaveIndexTest(unittest.TestCase):
+
+    def test_equal_intervals(self):
+        rows = [leave("a", "2026-10-19", "2026-10-23"), leave("b", "2026-10-19", "2026-10-23")]
+        index = LeaveIndex(rows)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.who_is_out("2026-10-21"), ["a", "b"])
+        self.assertEqual(index.daily_out_counts("2026-10-19", "2026-10-19")[date(2026, 10, 19)], 2)
+
+    def test_overlapping_spans_for_one_person_count_once(self):
+        rows = [leave("a", "2026-10-01", "2026-10-10"), leave("a", "2026-10-05", "2026-10-15"),
+                leave("a", "2026-10-16", "2026-10-16")]
+        counts = LeaveIndex(rows).daily_out_counts("2026-09-30", "2026-10-17")
+        self.assertEqual(counts, brute_force_counts(rows, "2026-09-30", "2026-10-17"))
+        self.assertEqual(max(counts.values()), 1)
+
+    def test_window_edges(self):
+        rows = [leave("ends_on_start", "2026-09-20", "2026-10-01"),
+                leave("starts_on_end", "2026-10-31", "2026-11-05"),
+                leave("before", "2026-09-01", "2026-09-30"),
+                leave("after", "2026-11-01", "2026-11-02"),
+                leave("straddles", "2026-09-01", "2026-12-01")]
+        index = LeaveIndex(rows)
+        found = {row["emp_id"] for row in index.overlapping("2026-10-01", "2026-10-31")}
+        self.assertEqual(found, {"ends_on_start", "starts_on_end", "straddles"})
+        counts = index.daily_out_counts("2026-10-01", "2026-10-31")
+        self.assertEqual(counts[date(2026, 10, 1)], 2)
+        self.assertEqual(counts[date(2026, 10, 2)], 1)
+        self.assertEqual(counts[date(2026, 10, 31)], 2)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(0)
+        rows = []
+        for _ in range(500):
+            start = date(2026, 1, 1) + timedelta(days=rng.randrange(365))
+            end = start + timedelta(days=rng.randrange(15))
+            rows.append(leave(f"e{rng.randrange(40)}", start.isoformat(), end.isoformat()))
+        index = LeaveIndex(rows)
+        self.assertEqual(index.daily_out_counts("2026-03-01", "2026-06-30"),
+                         brute_force_counts(rows, "2026-03-01", "2026-06-30"))
+
+
+class CoverageMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("CREATE TABLE employees (emp_id TEXT, name TEXT, manager_emp_id TEXT)")
+        self.conn.execute("""CREATE TABLE leaves (id INTEGER PRIMARY KEY, emp_id TEXT, start_date TEXT,
+                             end_date TEXT, leave_type TEXT, status TEXT)""")
+        self.conn.executemany("INSERT INTO employees VALUES (?,?,?)",
+                              [("a", "Ann", "m"), ("b", "Bob", "m"), ("c", "Cy", "m"), ("x", "Xi", "other")])
+        self.conn.executemany(
+            "INSERT INTO leaves (emp_id, start_date, end_date, leave_type, status) VALUES (?,?,?,?,?)",
+            [("a", "2026-10-19", "2026-10-23", "Annual", "Approve"),
+             ("b", "2026-10-19", "2026-10-23", "Annual", "Pending"),
+             ("c", "2026-10-20", "2026-10-20", "Sick", "Reject"),
+             ("x", "2026-10-19", "2026-10-23", "Annual", "Approve")])
+
+    def test_same_holiday_for_two_teammates(self):
+        days, cells, counts = leave_calendar.coverage_matrix(self.conn, "m", "2026-10-18", "2026-10-24")
+        self.assertEqual(len(days), 7)
+        self.assertEqual(set(cells), {"a", "b", "c"})
+        self.assertEqual(cells["a"][0], "")
+        self.assertEqual(cells["a"][1]["leave_type"], "Annual")
+        self.assertEqual(cells["b"][5]["status"], "Pending")
+        self.assertEqual(cells["c"], [""] * 7)  # Rejected leave doesn't occupy the calendar
+        self.assertEqual([counts[day] for day in days], [0, 2, 2, 2, 2, 2, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()